@@ -9,12 +9,15 @@ import threading
 import numpy as np
 from datetime import datetime
 import time
+import os
+import json
 from flask_socketio import SocketIO
 
 app = Flask(__name__)
 
 # Initialize video capture
-cap = cv2.VideoCapture(0)
+CAMERA_INDEX = 0
+cap = cv2.VideoCapture(CAMERA_INDEX)
 cap.set(3, 740)  # Width
 cap.set(4, 480)  # Height
 cap.set(5, 30)
@@ -60,6 +63,188 @@ detection_history = []
 person_database = {}  # Will store unique person signatures
 next_person_id = 1    # Counter for new person IDs
 
+# Region-of-interest zones, keyed by camera index.
+# Points are normalized (0-1) so zones survive resolution changes.
+# 'include' zones restrict detection to their area (the whole frame if none are
+# defined), 'exclude' zones are always masked out. The SSD input size is fixed,
+# so for it zones only cut false alerts; YOLO gets a smaller input size when the
+# zones' bounding rectangle is smaller than its default. Entry/exit events are only
+# produced for named include zones, since nobody is tracked inside an exclude
+# zone. Zone names must be unique per camera. Leave a camera's list empty to
+# process the full frame.
+ZONES = {
+    0: [
+        # {'name': 'Entrance', 'type': 'include', 'points': [(0.05, 0.3), (0.6, 0.3), (0.6, 1.0), (0.05, 1.0)]},
+        # {'name': 'Street Window', 'type': 'exclude', 'points': [(0.7, 0.0), (1.0, 0.0), (1.0, 0.4), (0.7, 0.4)]},
+    ]
+}
+zoneFile = 'zones.json'
+if os.path.exists(zoneFile):
+    with open(zoneFile, 'rt') as f:
+        ZONES = {int(cam): zones for cam, zones in json.load(f).items()}
+
+def validate_zones(zones_by_camera):
+    """Check the zone configuration up front so a bad zone fails at startup, not mid-stream"""
+    for camera_index, zones in zones_by_camera.items():
+        if not isinstance(zones, list):
+            raise ValueError(f"Zones for camera {camera_index} must be a list")
+        names = set()
+        for i, zone in enumerate(zones):
+            if not isinstance(zone, dict):
+                raise ValueError(f"Zone {i} on camera {camera_index} must be a dict, got {zone!r}")
+            label = f"Zone {zone.get('name', i)!r} on camera {camera_index}"
+            if zone.get('type', 'include') not in ('include', 'exclude'):
+                raise ValueError(f"{label}: type must be 'include' or 'exclude', got {zone.get('type')!r}")
+            points = zone.get('points')
+            if not isinstance(points, (list, tuple)) or len(points) < 3:
+                raise ValueError(f"{label}: 'points' must be a list of at least 3 (x, y) pairs")
+            for point in points:
+                if (not isinstance(point, (list, tuple)) or len(point) != 2
+                        or not all(isinstance(v, (int, float)) and not isinstance(v, bool) and 0 <= v <= 1 for v in point)):
+                    raise ValueError(f"{label}: invalid point {point!r}, expected normalized (x, y) in 0-1")
+            name = zone.get('name')
+            if name is not None:
+                if not isinstance(name, str) or not name:
+                    raise ValueError(f"{label}: 'name' must be a non-empty string, got {name!r}")
+                if name in names:
+                    raise ValueError(f"{label}: duplicate zone name")
+                names.add(name)
+
+validate_zones(ZONES)
+
+zone_masks = {}          # Cached (mask, bounding rect) per frame shape
+zone_membership = {}     # person_id -> set of zone names the person is currently in
+zone_event_history = []  # Recent zone entry/exit events
+zone_event_counter = 0   # Makes zone event ids unique
+zone_lock = threading.Lock()
+ZONE_EXIT_GRACE = 1.5    # Seconds a person may go unseen before leaving their zones
+
+def get_camera_zones(camera_index=CAMERA_INDEX):
+    """Return the configured zones for a camera"""
+    return ZONES.get(camera_index, [])
+
+def zone_polygon(zone, w, h):
+    """Scale a zone's normalized points to pixel coordinates"""
+    return np.array([(int(px * w), int(py * h)) for px, py in zone['points']], dtype=np.int32)
+
+def get_zone_mask(frame_shape, camera_index=CAMERA_INDEX):
+    """Build (and cache) the detection mask and its bounding rectangle for a frame size"""
+    h, w = frame_shape[:2]
+    key = (camera_index, h, w)
+    if key not in zone_masks:
+        zones = get_camera_zones(camera_index)
+        include_zones = [z for z in zones if z.get('type', 'include') == 'include']
+        exclude_zones = [z for z in zones if z.get('type') == 'exclude']
+
+        if include_zones:
+            mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(mask, [zone_polygon(z, w, h) for z in include_zones], 255)
+        else:
+            mask = np.full((h, w), 255, dtype=np.uint8)
+        if exclude_zones:
+            cv2.fillPoly(mask, [zone_polygon(z, w, h) for z in exclude_zones], 0)
+
+        zone_masks[key] = (mask, cv2.boundingRect(mask))
+    return zone_masks[key]
+
+def apply_zone_mask(frame, camera_index=CAMERA_INDEX):
+    """Crop the frame to the zones' bounding rectangle and black out masked areas.
+
+    Returns (roi, (offset_x, offset_y)), or (None, (0, 0)) if nothing is left to
+    process. Without zones the frame itself is returned untouched.
+    """
+    if not get_camera_zones(camera_index):
+        return frame, (0, 0)
+
+    mask, (rx, ry, rw, rh) = get_zone_mask(frame.shape, camera_index)
+    if rw == 0 or rh == 0:
+        return None, (0, 0)
+
+    crop = frame[ry:ry+rh, rx:rx+rw]
+    roi = cv2.bitwise_and(crop, crop, mask=mask[ry:ry+rh, rx:rx+rw])
+    return roi, (rx, ry)
+
+def zone_imgsz(roi, max_size=640):
+    """YOLO input size for a zone crop: the crop's longest side, rounded up to a stride of 32"""
+    longest = max(roi.shape[:2])
+    return min(max_size, -(-longest // 32) * 32)
+
+def point_in_zones(frame_shape, x, y, camera_index=CAMERA_INDEX):
+    """Check whether a pixel lies inside the active detection area"""
+    if not get_camera_zones(camera_index):
+        return True
+    mask, _ = get_zone_mask(frame_shape, camera_index)
+    h, w = mask.shape
+    return 0 <= x < w and 0 <= y < h and mask[y, x] > 0
+
+def draw_zones(frame, camera_index=CAMERA_INDEX):
+    """Outline the configured zones on the frame"""
+    h, w = frame.shape[:2]
+    for zone in get_camera_zones(camera_index):
+        color = (0, 0, 255) if zone.get('type') == 'exclude' else (255, 255, 0)
+        polygon = zone_polygon(zone, w, h)
+        cv2.polylines(frame, [polygon], True, color, 2)
+        cv2.putText(frame, zone.get('name', ''), tuple(int(v) for v in polygon[0]),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+def update_zone_events(frame_shape, timestamp, camera_index=CAMERA_INDEX):
+    """Emit zone entry/exit events from the tracked person positions.
+
+    A person counts as present while seen within ZONE_EXIT_GRACE seconds, so a
+    single missed detection does not produce an exit/enter pair. Transitions are
+    computed under zone_lock against the shared membership, so concurrent feeds
+    cannot emit the same event twice.
+    """
+    global zone_event_counter
+    h, w = frame_shape[:2]
+    zones = [z for z in get_camera_zones(camera_index)
+             if z.get('name') and z.get('type', 'include') == 'include']
+    if not zones:
+        return
+
+    polygons = {z['name']: zone_polygon(z, w, h) for z in zones}
+    current_time = time.time()
+    events = []
+
+    with zone_lock:
+        positions = {pid: data["position"] for pid, data in list(person_database.items())
+                     if current_time - data["last_seen"] <= ZONE_EXIT_GRACE}
+        tracked_ids = set(positions.keys()) | set(zone_membership.keys())
+
+        for person_id in tracked_ids:
+            previous = zone_membership.get(person_id, set())
+            current = set()
+            if person_id in positions:
+                cx, cy = positions[person_id]
+                current = {name for name, polygon in polygons.items()
+                           if cv2.pointPolygonTest(polygon, (float(cx), float(cy)), False) >= 0}
+
+            for zone_name, event in [(z, 'enter') for z in current - previous] + \
+                                    [(z, 'exit') for z in previous - current]:
+                zone_event_counter += 1
+                zone_event = {
+                    'id': f"{person_id}_{zone_name}_{event}_{zone_event_counter}",
+                    'person_id': person_id,
+                    'zone': zone_name,
+                    'event': event,
+                    'timestamp': timestamp,
+                    'type': 'INFO'
+                }
+                events.append(zone_event)
+                zone_event_history.append(zone_event)
+
+                # Keep only last 100 events
+                if len(zone_event_history) > 100:
+                    zone_event_history.pop(0)
+
+            if current:
+                zone_membership[person_id] = current
+            else:
+                zone_membership.pop(person_id, None)
+
+    for zone_event in events:
+        socketio.emit('zone_event', zone_event)
+
 def get_person_features(frame, x, y, w_box, h_box):
     """Extract basic features of a person to use for re-identification"""
     try:
@@ -220,8 +405,12 @@ def generate_object_detection_frames():
         h, w, _ = frame.shape
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        # General Object Detection with SSD MobileNet
-        classIds, confs, bbox = net.detect(frame, confThreshold=0.55, nmsThreshold=0.2)
+        # General Object Detection with SSD MobileNet, restricted to the configured zones
+        roi, (offset_x, offset_y) = apply_zone_mask(frame)
+        if roi is not None:
+            classIds, confs, bbox = net.detect(roi, confThreshold=0.55, nmsThreshold=0.2)
+        else:
+            classIds, confs, bbox = (), (), ()
 
         current_detections = {}
 
@@ -231,8 +420,8 @@ def generate_object_detection_frames():
 
             for detection_idx, (classId, conf, box) in enumerate(zip(classIds, confs, bbox)):
                 x, y, w_box, h_box = box
-                x = max(0, x)
-                y = max(0, y)
+                x = max(0, x + offset_x)
+                y = max(0, y + offset_y)
                 w_box = min(w_box, w - x)
                 h_box = min(h_box, h - y)
 
@@ -240,6 +429,10 @@ def generate_object_detection_frames():
                 center_x = x + w_box // 2
                 center_y = y + h_box // 2
 
+                # Skip detections centered in a masked-out area
+                if not point_in_zones(frame.shape, center_x, center_y):
+                    continue
+
                 # Check if this is a person detection (class 1 in COCO is person)
                 is_person = (classId == 1)
                 
@@ -299,6 +492,10 @@ def generate_object_detection_frames():
         # Update object positions
         object_positions = current_detections
 
+        # Zone entry/exit events from tracked person positions
+        update_zone_events(frame.shape, timestamp)
+        draw_zones(frame)
+
         # Debug info - show number of people being tracked
         person_count = len([pid for pid in person_database.keys()])
         cv2.putText(frame, f"Tracking {person_count} people", (10, 70),
@@ -334,18 +531,28 @@ def generate_thermal_frames():
 def detect_weapons(frame):
     """Detect weapons in frame using YOLOv8"""
     try:
-        # Run detection
-        results = model.predict(source=frame, conf=0.5, verbose=False)[0]
+        # Run detection only on the configured zones
+        roi, (offset_x, offset_y) = apply_zone_mask(frame)
+        detections = []
+        if roi is not None:
+            results = model.predict(source=roi, conf=0.5, verbose=False, imgsz=zone_imgsz(roi))[0]
+            detections = results.boxes.data
         
         # Process detections
-        for detection in results.boxes.data:
+        for detection in detections:
             x1, y1, x2, y2, conf, cls = detection
             class_name = results.names[int(cls)]
             
             # Only process weapons
             if class_name.lower() in WEAPON_CLASSES:
-                # Convert coordinates to integers
+                # Convert coordinates to integers, back in full-frame space
                 x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
+                x1, x2 = x1 + offset_x, x2 + offset_x
+                y1, y2 = y1 + offset_y, y2 + offset_y
+                
+                # Skip weapons centered in a masked-out area
+                if not point_in_zones(frame.shape, (x1 + x2) // 2, (y1 + y2) // 2):
+                    continue
                 
                 # Draw red box
                 cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
@@ -615,6 +822,11 @@ def get_detection_history():
     """Get the detection history"""
     return {'detections': detection_history}
 
+@app.route('/zone_events')
+def get_zone_events():
+    """Get the zone entry/exit history"""
+    return {'events': zone_event_history}
+
 @app.route('/person_database')
 def get_person_database():
     """Return current person tracking data"""